@@ -1,9 +1,14 @@
+import os
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 import torch
+from torch import nn
 from torchvision import models
 
+from torchdistill.core.distillation import DistillationBox
 from torchdistill.core.forward_hook import ForwardHookManager
+from torchdistill.core.util import compile_module, extract_io_dict, set_hooks
 
 
 class ForwardHookManagerUnitTest(TestCase):
@@ -49,3 +54,71 @@ class ForwardHookManagerUnitTest(TestCase):
         hooked_y = io_dict[target_module_path]['output']
         assert torch.equal(y, hooked_y)
         assert len(fhm.io_dict[target_module_path]['output']) == 0
+
+
+class ExtractIODictTest(TestCase):
+    def test_extract_io_dict_twice(self):
+        device = torch.device('cpu')
+        model = nn.Sequential(nn.Flatten(), nn.Linear(12, 4))
+        io_dict = dict()
+        pair_list = set_hooks(model, model, {'forward_hook': {'input': ['1'], 'output': ['1']}}, io_dict)
+        assert len(pair_list) == 1
+        module_io_dict = io_dict['1']
+        for _ in range(2):
+            x = torch.rand(2, 3, 2, 2)
+            y = model(x)
+            # Hooks keep filling the module-wise dict created at registration
+            assert io_dict['1'] is module_io_dict
+            assert len(module_io_dict['output']) == 1
+            extracted_io_dict = extract_io_dict(io_dict, device)
+            assert torch.equal(extracted_io_dict['1']['input'], torch.flatten(x, 1))
+            assert torch.equal(extracted_io_dict['1']['output'], y)
+            # Sub-dicts persist but are emptied, thus another extraction returns no stale output
+            assert len(module_io_dict['input']) == 0 and len(module_io_dict['output']) == 0
+            assert len(extract_io_dict(io_dict, device)['1']) == 0
+
+
+class CompileModuleTest(TestCase):
+    def test_compile_module_disabled(self):
+        module = torch.nn.Linear(2, 2)
+        assert compile_module(module, None) is module
+        assert compile_module(module, False) is module
+
+    def test_compile_module_enabled(self):
+        module = torch.nn.Linear(2, 2)
+        for compile_config in [True, {'mode': 'reduce-overhead', 'dynamic': False}]:
+            compiled_module = compile_module(module, compile_config)
+            if hasattr(torch, 'compile'):
+                assert compiled_module is not module
+                assert compiled_module._orig_mod is module
+            else:
+                assert compiled_module is module
+
+
+class DistillationBoxTest(TestCase):
+    def test_cache_teacher_output_with_updatable_teacher(self):
+        device = torch.device('cpu')
+        teacher_model = nn.Sequential(nn.Flatten(), nn.Linear(12, 4))
+        student_model = nn.Sequential(nn.Flatten(), nn.Linear(12, 4))
+        train_config = {
+            'num_epochs': 1,
+            'teacher': {'forward_hook': {'output': ['1']}},
+            'student': {'forward_hook': {'output': ['1']}},
+            'criterion': {
+                'type': 'GeneralizedCustomLoss',
+                'org_term': {'criterion': {'type': 'CrossEntropyLoss', 'params': dict()}, 'factor': 1.0}
+            },
+            'optimizer': {'type': 'SGD', 'params': {'lr': 0.1}}
+        }
+        box = DistillationBox(teacher_model, student_model, dict(), train_config, device, None, False, 1.0)
+        assert box.teacher_updatable
+        x = torch.rand(2, 3, 2, 2)
+        with TemporaryDirectory() as dir_path:
+            cache_file_paths = [os.path.join(dir_path, '{}.pt'.format(i)) for i in range(len(x))]
+            teacher_outputs, extracted_teacher_io_dict = \
+                box.get_teacher_output(x, None, supp_dict={'cache_file_path': cache_file_paths})
+            for i, cache_file_path in enumerate(cache_file_paths):
+                cache_dict = torch.load(cache_file_path)
+                assert torch.allclose(cache_dict['teacher_outputs'], teacher_outputs[i].detach())
+                cached_output = cache_dict['extracted_outputs']['1']['output']
+                assert torch.allclose(cached_output, extracted_teacher_io_dict['1']['output'][i].detach())
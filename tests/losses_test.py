@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+import torch
+
+from torchdistill.losses.single import KDLoss
+from torchdistill.losses.util import extract_batched_org_loss, extract_simple_org_loss
+
+
+class ExtractOrgLossTest(TestCase):
+    def test_extract_simple_org_loss_with_teacher_aux_outputs(self):
+        def org_criterion(student_outputs, teacher_outputs, targets):
+            return (student_outputs - teacher_outputs).abs().sum()
+
+        student_outputs = (torch.ones(2, 3), torch.zeros(2, 3))
+        teacher_outputs = (torch.zeros(2, 3), torch.zeros(2, 3))
+        org_loss_dict = extract_simple_org_loss(org_criterion, student_outputs, teacher_outputs, None,
+                                                uses_teacher_output=True)
+        assert len(org_loss_dict) == 2
+        assert org_loss_dict[0].item() == 6
+        assert org_loss_dict[1].item() == 0
+
+    def test_extract_batched_org_loss(self):
+        org_criterion = torch.nn.CrossEntropyLoss()
+        student_outputs = (torch.rand(4, 10), torch.rand(4, 10), torch.rand(4, 10))
+        targets = torch.randint(0, 10, (4,))
+        org_loss_dict = extract_batched_org_loss(org_criterion, student_outputs, None, targets,
+                                                 uses_teacher_output=False)
+        simple_org_loss_dict = extract_simple_org_loss(org_criterion, student_outputs, None, targets,
+                                                       uses_teacher_output=False)
+        assert len(org_loss_dict) == 1
+        assert torch.allclose(org_loss_dict[0], sum(simple_org_loss_dict.values()))
+
+    def test_extract_batched_org_loss_with_kd_loss(self):
+        org_criterion = KDLoss(temperature=4.0, alpha=0.5, reduction='batchmean')
+        student_outputs = (torch.rand(4, 10), torch.rand(4, 10))
+        teacher_outputs = (torch.rand(4, 10), torch.rand(4, 10))
+        for targets in [torch.randint(0, 10, (4,)), None]:
+            org_loss_dict = extract_batched_org_loss(org_criterion, student_outputs, teacher_outputs, targets,
+                                                     uses_teacher_output=True)
+            expected_org_loss = sum(org_criterion(sub_student_outputs, sub_teacher_outputs, targets)
+                                    for sub_student_outputs, sub_teacher_outputs
+                                    in zip(student_outputs, teacher_outputs))
+            assert len(org_loss_dict) == 1
+            assert torch.allclose(org_loss_dict[0], expected_org_loss)
@@ -1,18 +1,18 @@
-import copy
 import sys
 
 import torch
 from torch import distributed as dist
 from torch import nn
+from torch.nn import DataParallel
 from torch.optim.lr_scheduler import ReduceLROnPlateau, LambdaLR
 
 from torchdistill.common.constant import def_logger
 from torchdistill.common.file_util import make_parent_dirs
 from torchdistill.common.module_util import check_if_wrapped, freeze_module_params, get_module, unfreeze_module_params, \
     get_updatable_param_names
-from torchdistill.core.forward_proc import get_forward_proc_func
-from torchdistill.core.util import set_hooks, wrap_model, change_device, tensor2numpy2tensor, clear_io_dict, \
-    extract_io_dict, update_io_dict, extract_sub_model_output_dict
+from torchdistill.core.forward_proc import get_forward_proc_func, forward_batch_only, forward_batch4sskd
+from torchdistill.core.util import set_hooks, wrap_model, compile_module, change_device, detach_clone, \
+    tensor2numpy2tensor, clear_io_dict, extract_io_dict, update_io_dict, extract_sub_model_output_dict
 from torchdistill.datasets.util import build_data_loaders
 from torchdistill.losses.custom import get_custom_loss
 from torchdistill.losses.single import ORG_LOSS_LIST, get_single_loss
@@ -44,10 +44,8 @@ class DistillationBox(nn.Module):
             self.val_data_loader = val_data_loader
 
     def setup_teacher_student_models(self, teacher_config, student_config):
-        unwrapped_org_teacher_model =\
-            self.org_teacher_model.module if check_if_wrapped(self.org_teacher_model) else self.org_teacher_model
-        unwrapped_org_student_model = \
-            self.org_student_model.module if check_if_wrapped(self.org_student_model) else self.org_student_model
+        unwrapped_org_teacher_model = self.unwrapped_org_teacher_model
+        unwrapped_org_student_model = self.unwrapped_org_student_model
         self.target_teacher_pairs.clear()
         self.target_student_pairs.clear()
         teacher_ref_model = unwrapped_org_teacher_model
@@ -91,6 +89,7 @@ class DistillationBox(nn.Module):
             else get_single_loss(org_criterion_config)
         self.criterion = get_custom_loss(criterion_config)
         logger.info(self.criterion)
+        self.criterion = compile_module(self.criterion, criterion_config.get('compile', None))
         self.uses_teacher_output = \
             self.org_criterion is not None and isinstance(self.org_criterion, tuple(ORG_LOSS_LIST))
         self.extract_org_loss = get_func2extract_org_output(criterion_config.get('func2extract_org_loss', None))
@@ -118,6 +117,13 @@ class DistillationBox(nn.Module):
             logger.info('Freezing the whole student model')
             freeze_module_params(self.student_model)
 
+        # Skip teacher's forward if neither sub-terms nor original criterion use teacher's outputs
+        sub_terms_config = train_config['criterion'].get('sub_terms', None)
+        self.requires_teacher_forward = self.teacher_updatable or self.uses_teacher_output \
+            or (sub_terms_config is not None and len(sub_terms_config) > 0)
+        if not self.requires_teacher_forward:
+            logger.info('Teacher\'s forward is skipped as no loss term uses teacher\'s outputs')
+
         # Wrap models if necessary
         teacher_unused_parameters = teacher_config.get('find_unused_parameters', self.teacher_any_frozen)
         teacher_any_updatable = len(get_updatable_param_names(self.teacher_model)) > 0
@@ -202,12 +208,47 @@ class DistillationBox(nn.Module):
                 amp.initialize(self.student_model, self.optimizer, opt_level=apex_config['opt_level'])
             self.apex = True
 
+        # Resolve special modules once per stage so that forward does not need to inspect model wrappers
+        unwrapped_teacher_model = \
+            self.teacher_model.module if check_if_wrapped(self.teacher_model) else self.teacher_model
+        self.teacher_uses_special_module = isinstance(unwrapped_teacher_model, SpecialModule)
+        self.special_teacher_model = self.teacher_model if isinstance(self.teacher_model, SpecialModule) else None
+        self.special_student_model = self.student_model if isinstance(self.student_model, SpecialModule) else None
+
+        # Channels-last memory format lets cuDNN pick faster (e.g., Tensor Core) kernels for convolutional teachers
+        self.teacher_channels_last = teacher_config.get('uses_channels_last', False)
+        if self.teacher_channels_last:
+            self.teacher_model = self.teacher_model.to(memory_format=torch.channels_last)
+
+        # Frozen teacher can be run on a side CUDA stream so that its forward overlaps with student's forward
+        self.teacher_stream = None
+        if teacher_config.get('uses_side_stream', False):
+            if self.device.type == 'cuda' and not self.teacher_updatable \
+                    and not (isinstance(self.teacher_model, DataParallel) and len(self.teacher_model.device_ids) > 1):
+                self.teacher_stream = torch.cuda.Stream(device=self.device)
+            else:
+                logger.info('Side stream for teacher is available only for frozen teacher on a single CUDA device')
+
+        # Frozen teacher's forward can be captured as a CUDA graph once and replayed for inputs of the same shape
+        self.uses_teacher_cuda_graph = False
+        self.teacher_graph, self.teacher_static_input, self.teacher_static_output = None, None, None
+        self.teacher_static_io_dict = None
+        if teacher_config.get('uses_cuda_graph', False):
+            if self.device.type == 'cuda' and not self.teacher_updatable and not check_if_wrapped(self.teacher_model) \
+                    and self.teacher_forward_proc in (forward_batch_only, forward_batch4sskd):
+                self.uses_teacher_cuda_graph = True
+            else:
+                logger.info('CUDA graph for teacher is available only for frozen, unwrapped teacher on CUDA '
+                            'whose forward_proc takes only sample_batch')
+
     def __init__(self, teacher_model, student_model, dataset_dict,
                  train_config, device, device_ids, distributed, lr_factor, accelerator=None):
         super().__init__()
         # Key attributes (should not be modified)
         self.org_teacher_model = teacher_model
         self.org_student_model = student_model
+        self.unwrapped_org_teacher_model = teacher_model.module if check_if_wrapped(teacher_model) else teacher_model
+        self.unwrapped_org_student_model = student_model.module if check_if_wrapped(student_model) else student_model
         self.dataset_dict = dataset_dict
         self.device = device
         self.device_ids = device_ids
@@ -223,14 +264,26 @@ class DistillationBox(nn.Module):
         self.train_data_loader, self.val_data_loader, self.optimizer, self.lr_scheduler = None, None, None, None
         self.org_criterion, self.criterion, self.uses_teacher_output, self.extract_org_loss = None, None, None, None
         self.teacher_updatable, self.teacher_any_frozen, self.student_any_frozen = None, None, None
+        self.requires_teacher_forward = True
         self.grad_accum_step = None
         self.max_grad_norm = None
         self.scheduling_step = 0
         self.stage_grad_count = 0
         self.apex = None
+        self.teacher_uses_special_module, self.special_teacher_model, self.special_student_model = False, None, None
+        self.teacher_channels_last = False
+        self.teacher_stream = None
+        self.uses_teacher_cuda_graph, self.teacher_graph = False, None
+        self.teacher_static_input, self.teacher_static_output, self.teacher_static_io_dict = None, None, None
         self.setup(train_config)
         self.num_epochs = train_config['num_epochs']
 
+    def train(self, mode=True):
+        super().train(mode)
+        # Keep teacher in eval mode (e.g., BatchNorm and Dropout) even when the box is set to training mode
+        self.teacher_model.eval()
+        return self
+
     def pre_process(self, epoch=None, **kwargs):
         clear_io_dict(self.teacher_io_dict)
         clear_io_dict(self.student_io_dict)
@@ -239,12 +292,52 @@ class DistillationBox(nn.Module):
         if self.distributed:
             self.train_data_loader.batch_sampler.sampler.set_epoch(epoch)
 
+    def forward_teacher_with_cuda_graph(self, sample_batch, targets, supp_dict):
+        if not isinstance(sample_batch, torch.Tensor):
+            # e.g., dict/list batches cannot be fed into a static input tensor, thus use eager forward
+            return None
+
+        if self.teacher_graph is None:
+            self.teacher_static_input = sample_batch.clone()
+            # Warm up on a side stream before capture as required by CUDA graphs
+            warmup_stream = torch.cuda.Stream(device=self.device)
+            warmup_stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(warmup_stream):
+                for _ in range(3):
+                    self.teacher_forward_proc(self.teacher_model, self.teacher_static_input, targets, supp_dict)
+            torch.cuda.current_stream(self.device).wait_stream(warmup_stream)
+            self.teacher_graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self.teacher_graph):
+                self.teacher_static_output = \
+                    self.teacher_forward_proc(self.teacher_model, self.teacher_static_input, targets, supp_dict)
+
+            # Forward hooks fire only during capture, thus keep their (static) tensors to restore them at each replay
+            self.teacher_static_io_dict = \
+                {module_path: {io_type: dict(sub_dict) for io_type, sub_dict in module_io_dict.items()}
+                 for module_path, module_io_dict in self.teacher_io_dict.items()}
+        elif sample_batch.shape != self.teacher_static_input.shape \
+                or sample_batch.dtype != self.teacher_static_input.dtype:
+            # Fall back to eager forward e.g., for the last (smaller) batch
+            return None
+
+        self.teacher_static_input.copy_(sample_batch)
+        self.teacher_graph.replay()
+        for module_path, module_io_dict in self.teacher_static_io_dict.items():
+            teacher_module_io_dict = self.teacher_io_dict[module_path]
+            for io_type, sub_dict in module_io_dict.items():
+                # Refill the live dicts in place to avoid building new dicts at every replay
+                teacher_module_io_dict.setdefault(io_type, dict()).update(sub_dict)
+        return self.teacher_static_output
+
     def get_teacher_output(self, sample_batch, targets, supp_dict):
         if supp_dict is None:
             supp_dict = dict()
 
         cached_data = supp_dict.get('cached_data', None)
         cache_file_paths = supp_dict.get('cache_file_path', None)
+        if not self.requires_teacher_forward and not isinstance(cache_file_paths, (list, tuple)):
+            return None, dict()
+
         teacher_outputs = None
         cached_extracted_teacher_output_dict = None
         # Use cached data if available
@@ -260,28 +353,39 @@ class DistillationBox(nn.Module):
 
         # If no cached data
         if teacher_outputs is None:
+            if self.teacher_channels_last and isinstance(sample_batch, torch.Tensor) and sample_batch.dim() == 4:
+                sample_batch = sample_batch.contiguous(memory_format=torch.channels_last)
+
             if self.teacher_updatable:
                 teacher_outputs = self.teacher_forward_proc(self.teacher_model, sample_batch, targets, supp_dict)
             else:
                 with torch.no_grad():
-                    teacher_outputs = self.teacher_forward_proc(self.teacher_model, sample_batch, targets, supp_dict)
+                    if self.uses_teacher_cuda_graph:
+                        teacher_outputs = self.forward_teacher_with_cuda_graph(sample_batch, targets, supp_dict)
+                    if teacher_outputs is None:
+                        teacher_outputs = \
+                            self.teacher_forward_proc(self.teacher_model, sample_batch, targets, supp_dict)
 
         if cached_extracted_teacher_output_dict is not None:
-            if isinstance(self.teacher_model, SpecialModule) or \
-                    (check_if_wrapped(self.teacher_model) and isinstance(self.teacher_model.module, SpecialModule)):
-                self.teacher_io_dict.update(cached_extracted_teacher_output_dict)
-                if isinstance(self.teacher_model, SpecialModule):
-                    self.teacher_model.post_forward(self.teacher_io_dict)
+            if self.teacher_uses_special_module:
+                # Update module-wise dicts in place as forward hooks hold references to them
+                for module_path, module_io_dict in cached_extracted_teacher_output_dict.items():
+                    sub_io_dict = self.teacher_io_dict.setdefault(module_path, dict())
+                    sub_io_dict.clear()
+                    sub_io_dict.update(module_io_dict)
+                if self.special_teacher_model is not None:
+                    self.special_teacher_model.post_forward(self.teacher_io_dict)
 
             extracted_teacher_io_dict = extract_io_dict(self.teacher_io_dict, self.device)
             return teacher_outputs, extracted_teacher_io_dict
 
-        # Deep copy of teacher info dict if teacher special module contains trainable module(s)
-        teacher_io_dict4cache = copy.deepcopy(self.teacher_io_dict) \
-            if self.teacher_updatable and isinstance(cache_file_paths, (list, tuple)) is not None else None
         extracted_teacher_io_dict = extract_io_dict(self.teacher_io_dict, self.device)
-        if isinstance(self.teacher_model, SpecialModule):
-            self.teacher_model.post_forward(extracted_teacher_io_dict)
+        # Detached copy of extracted teacher info dict (before post_forward) if teacher special module contains
+        # trainable module(s) and cache files are to be written, so that it does not keep teacher's autograd graph alive
+        teacher_io_dict4cache = detach_clone(extracted_teacher_io_dict) \
+            if self.teacher_updatable and isinstance(cache_file_paths, (list, tuple)) else None
+        if self.special_teacher_model is not None:
+            self.special_teacher_model.post_forward(extracted_teacher_io_dict)
 
         update_io_dict(extracted_teacher_io_dict, extract_io_dict(self.teacher_io_dict, self.device))
         # Write cache files if output file paths (cache_file_paths) are given
@@ -290,7 +394,8 @@ class DistillationBox(nn.Module):
                 teacher_io_dict4cache = extracted_teacher_io_dict
 
             cpu_device = torch.device('cpu')
-            for i, (teacher_output, cache_file_path) in enumerate(zip(teacher_outputs.cpu().numpy(), cache_file_paths)):
+            teacher_output_array = teacher_outputs.detach().cpu().numpy()
+            for i, (teacher_output, cache_file_path) in enumerate(zip(teacher_output_array, cache_file_paths)):
                 sub_dict = extract_sub_model_output_dict(teacher_io_dict4cache, i)
                 sub_dict = tensor2numpy2tensor(sub_dict, cpu_device)
                 cache_dict = {'teacher_outputs': torch.Tensor(teacher_output), 'extracted_outputs': sub_dict}
@@ -299,12 +404,23 @@ class DistillationBox(nn.Module):
         return teacher_outputs, extracted_teacher_io_dict
 
     def forward(self, sample_batch, targets, supp_dict):
-        teacher_outputs, extracted_teacher_io_dict =\
-            self.get_teacher_output(sample_batch, targets, supp_dict=supp_dict)
+        if self.teacher_stream is not None:
+            self.teacher_stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(self.teacher_stream):
+                teacher_outputs, extracted_teacher_io_dict = \
+                    self.get_teacher_output(sample_batch, targets, supp_dict=supp_dict)
+        else:
+            teacher_outputs, extracted_teacher_io_dict =\
+                self.get_teacher_output(sample_batch, targets, supp_dict=supp_dict)
+
         student_outputs = self.student_forward_proc(self.student_model, sample_batch, targets, supp_dict)
         extracted_student_io_dict = extract_io_dict(self.student_io_dict, self.device)
-        if isinstance(self.student_model, SpecialModule):
-            self.student_model.post_forward(extracted_student_io_dict)
+        if self.special_student_model is not None:
+            self.special_student_model.post_forward(extracted_student_io_dict)
+
+        # Teacher's outputs are consumed on the current stream from here
+        if self.teacher_stream is not None:
+            torch.cuda.current_stream(self.device).wait_stream(self.teacher_stream)
 
         org_loss_dict = self.extract_org_loss(self.org_criterion, student_outputs, teacher_outputs, targets,
                                               uses_teacher_output=self.uses_teacher_output, supp_dict=supp_dict)
@@ -359,10 +475,10 @@ class DistillationBox(nn.Module):
                 self.lr_scheduler.step(epoch)
             else:
                 self.lr_scheduler.step()
-        if isinstance(self.teacher_model, SpecialModule):
-            self.teacher_model.post_process()
-        if isinstance(self.student_model, SpecialModule):
-            self.student_model.post_process()
+        if self.special_teacher_model is not None:
+            self.special_teacher_model.post_process()
+        if self.special_student_model is not None:
+            self.special_student_model.post_process()
         if self.distributed:
             dist.barrier()
 
@@ -1,7 +1,6 @@
 from collections import abc
 
 import torch
-from torch._six import string_classes
 from torch.nn.parallel.scatter_gather import gather
 
 from torchdistill.common.module_util import check_if_wrapped, get_module
@@ -21,7 +20,7 @@ def get_device_index(data):
             result = get_device_index(d)
             if result is not None:
                 return result
-    elif isinstance(data, abc.Sequence) and not isinstance(data, string_classes):
+    elif isinstance(data, abc.Sequence) and not isinstance(data, str):
         for d in data:
             result = get_device_index(d)
             if result is not None:
@@ -30,14 +29,15 @@ def get_device_index(data):
 
 
 def register_forward_hook_with_dict(module, module_path, requires_input, requires_output, io_dict):
-    io_dict[module_path] = dict()
+    # Hooks write into this dict directly without looking it up in io_dict at every forward
+    sub_io_dict = dict()
+    io_dict[module_path] = sub_io_dict
 
     def forward_hook4input(self, func_input, func_output):
         if isinstance(func_input, tuple) and len(func_input) == 1:
             func_input = func_input[0]
 
         device_index = get_device_index(func_output)
-        sub_io_dict = io_dict[module_path]
         if 'input' not in sub_io_dict:
             sub_io_dict['input'] = dict()
         sub_io_dict['input'][device_index] = func_input
@@ -47,7 +47,6 @@ def register_forward_hook_with_dict(module, module_path, requires_input, require
             func_output = func_output[0]
 
         device_index = get_device_index(func_output)
-        sub_io_dict = io_dict[module_path]
         if 'output' not in sub_io_dict:
             sub_io_dict['output'] = dict()
         sub_io_dict['output'][device_index] = func_output
@@ -59,7 +58,6 @@ def register_forward_hook_with_dict(module, module_path, requires_input, require
             func_output = func_output[0]
 
         device_index = get_device_index(func_output)
-        sub_io_dict = io_dict[module_path]
         if 'input' not in sub_io_dict:
             sub_io_dict['input'] = dict()
 
@@ -113,8 +111,13 @@ class ForwardHookManager(object):
             gathered_io_dict[module_path] = dict()
             for io_type in list(module_io_dict.keys()):
                 sub_dict = module_io_dict.pop(io_type)
-                values = [sub_dict[key] for key in sorted(sub_dict.keys())]
-                gathered_obj = gather(values, self.target_device) if self.uses_cuda and len(values) > 1 else values[-1]
+                if len(sub_dict) == 1:
+                    # Single device: no need to sort device keys and gather values
+                    gathered_obj = next(iter(sub_dict.values()))
+                else:
+                    values = [sub_dict[key] for key in sorted(sub_dict.keys())]
+                    gathered_obj = \
+                        gather(values, self.target_device) if self.uses_cuda and len(values) > 1 else values[-1]
                 gathered_io_dict[module_path][io_type] = gathered_obj
         return gathered_io_dict
 
@@ -9,7 +9,7 @@ from torchdistill.common.constant import def_logger
 from torchdistill.common.module_util import check_if_wrapped, freeze_module_params, get_module, unfreeze_module_params, \
     get_updatable_param_names
 from torchdistill.core.forward_proc import get_forward_proc_func
-from torchdistill.core.util import set_hooks, wrap_model, clear_io_dict, extract_io_dict, update_io_dict
+from torchdistill.core.util import set_hooks, wrap_model, compile_module, clear_io_dict, extract_io_dict, update_io_dict
 from torchdistill.datasets.util import build_data_loaders
 from torchdistill.losses.custom import get_custom_loss
 from torchdistill.losses.single import get_single_loss
@@ -41,8 +41,7 @@ class TrainingBox(nn.Module):
             self.val_data_loader = val_data_loader
 
     def setup_model(self, model_config):
-        unwrapped_org_model = \
-            self.org_model.module if check_if_wrapped(self.org_model) else self.org_model
+        unwrapped_org_model = self.unwrapped_org_model
         self.target_model_pairs.clear()
         ref_model = unwrapped_org_model
 
@@ -69,6 +68,7 @@ class TrainingBox(nn.Module):
             else get_single_loss(org_criterion_config)
         self.criterion = get_custom_loss(criterion_config)
         logger.info(self.criterion)
+        self.criterion = compile_module(self.criterion, criterion_config.get('compile', None))
         self.uses_teacher_output = False
         self.extract_org_loss = get_func2extract_org_output(criterion_config.get('func2extract_org_loss', None))
 
@@ -152,10 +152,14 @@ class TrainingBox(nn.Module):
                 amp.initialize(self.model, self.optimizer, opt_level=apex_config['opt_level'])
             self.apex = True
 
+        # Resolve special module once per stage so that forward does not need to inspect model type
+        self.special_model = self.model if isinstance(self.model, SpecialModule) else None
+
     def __init__(self, model, dataset_dict, train_config, device, device_ids, distributed, lr_factor, accelerator=None):
         super().__init__()
         # Key attributes (should not be modified)
         self.org_model = model
+        self.unwrapped_org_model = model.module if check_if_wrapped(model) else model
         self.dataset_dict = dataset_dict
         self.device = device
         self.device_ids = device_ids
@@ -175,6 +179,7 @@ class TrainingBox(nn.Module):
         self.scheduling_step = 0
         self.stage_grad_count = 0
         self.apex = None
+        self.special_model = None
         self.setup(train_config)
         self.num_epochs = train_config['num_epochs']
 
@@ -187,8 +192,8 @@ class TrainingBox(nn.Module):
     def forward(self, sample_batch, targets, supp_dict):
         model_outputs = self.model_forward_proc(self.model, sample_batch, targets, supp_dict)
         extracted_model_io_dict = extract_io_dict(self.model_io_dict, self.device)
-        if isinstance(self.model, SpecialModule):
-            self.model.post_forward(extracted_model_io_dict)
+        if self.special_model is not None:
+            self.special_model.post_forward(extracted_model_io_dict)
 
         teacher_outputs = None
         org_loss_dict = self.extract_org_loss(self.org_criterion, model_outputs, teacher_outputs, targets,
@@ -243,8 +248,8 @@ class TrainingBox(nn.Module):
                 self.lr_scheduler.step(epoch)
             else:
                 self.lr_scheduler.step()
-        if isinstance(self.model, SpecialModule):
-            self.model.post_process()
+        if self.special_model is not None:
+            self.special_model.post_process()
         if self.distributed:
             dist.barrier()
 
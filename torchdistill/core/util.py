@@ -10,10 +10,7 @@ from torchdistill.common.module_util import get_module, check_if_wrapped
 from torchdistill.core.forward_hook import register_forward_hook_with_dict
 
 logger = def_logger.getChild(__name__)
-
-
-def set_distillation_box_info(io_dict, module_path, **kwargs):
-    io_dict[module_path] = kwargs
+DDP_COMM_HOOK_NAMES = ('allreduce_hook', 'fp16_compress_hook', 'bf16_compress_hook')
 
 
 def extract_module(org_model, sub_model, module_path):
@@ -33,7 +30,6 @@ def set_hooks(model, unwrapped_org_model, model_config, io_dict):
     for target_module_path in input_module_path_set.union(output_module_path_set):
         requires_input = target_module_path in input_module_path_set
         requires_output = target_module_path in output_module_path_set
-        set_distillation_box_info(io_dict, target_module_path)
         target_module = extract_module(unwrapped_org_model, model, target_module_path)
         handle = register_forward_hook_with_dict(target_module, target_module_path,
                                                  requires_input, requires_output, io_dict)
@@ -47,12 +43,35 @@ def wrap_model(model, model_config, device, device_ids=None, distributed=False,
     model.to(device)
     if wrapper is not None and device.type.startswith('cuda') and not check_if_wrapped(model):
         if wrapper == 'DistributedDataParallel' and distributed and any_updatable:
-            model = DistributedDataParallel(model, device_ids=device_ids, find_unused_parameters=find_unused_parameters)
+            # Static graph lets DDP overlap allreduce with backward even if some parameters are unused
+            static_graph = model_config.get('static_graph', False)
+            model = DistributedDataParallel(model, device_ids=device_ids, find_unused_parameters=find_unused_parameters,
+                                            static_graph=static_graph)
+            comm_hook_name = model_config.get('comm_hook', None)
+            if comm_hook_name is not None:
+                from torch.distributed.algorithms.ddp_comm_hooks import default_hooks
+                if comm_hook_name not in DDP_COMM_HOOK_NAMES:
+                    raise ValueError('comm_hook `{}` is not expected. Supported comm_hooks: {}'.format(
+                        comm_hook_name, DDP_COMM_HOOK_NAMES))
+                model.register_comm_hook(None, getattr(default_hooks, comm_hook_name))
         elif wrapper in {'DataParallel', 'DistributedDataParallel'}:
             model = DataParallel(model, device_ids=device_ids)
     return model
 
 
+def compile_module(module, compile_config):
+    if compile_config is None or compile_config is False:
+        return module
+
+    if not hasattr(torch, 'compile'):
+        logger.info('`torch.compile` is not available in torch {}, using the module as is'.format(torch.__version__))
+        return module
+
+    compile_kwargs = compile_config if isinstance(compile_config, dict) else dict()
+    logger.info('Compiling `{}` with {}'.format(type(module).__name__, compile_kwargs))
+    return torch.compile(module, **compile_kwargs)
+
+
 def change_device(data, device):
     elem_type = type(data)
     if isinstance(data, torch.Tensor):
@@ -69,6 +88,19 @@ def change_device(data, device):
     return data
 
 
+def detach_clone(data):
+    elem_type = type(data)
+    if isinstance(data, torch.Tensor):
+        return data.detach().clone()
+    elif isinstance(data, tuple) and hasattr(data, '_fields'):  # namedtuple
+        return elem_type(*(detach_clone(d) for d in data))
+    elif isinstance(data, (list, tuple)):
+        return elem_type(detach_clone(d) for d in data)
+    elif isinstance(data, abc.Mapping):
+        return {key: detach_clone(data[key]) for key in data}
+    return data
+
+
 def tensor2numpy2tensor(data, device):
     elem_type = type(data)
     if isinstance(data, torch.Tensor):
@@ -96,11 +128,19 @@ def extract_io_dict(model_io_dict, target_device):
     gathered_io_dict = dict()
     for module_path, module_io_dict in model_io_dict.items():
         gathered_io_dict[module_path] = dict()
-        for io_type in list(module_io_dict.keys()):
-            sub_dict = module_io_dict.pop(io_type)
-            values = [sub_dict[key] for key in sorted(sub_dict.keys())]
-            gathered_obj = gather(values, target_device) if uses_cuda and len(values) > 1 else values[-1]
+        for io_type, sub_dict in module_io_dict.items():
+            if len(sub_dict) == 0:
+                continue
+
+            if len(sub_dict) == 1:
+                # Single device: no need to sort device keys and gather values
+                gathered_obj = next(iter(sub_dict.values()))
+            else:
+                values = [sub_dict[key] for key in sorted(sub_dict.keys())]
+                gathered_obj = gather(values, target_device) if uses_cuda and len(values) > 1 else values[-1]
             gathered_io_dict[module_path][io_type] = gathered_obj
+            # Clear in place instead of popping so that forward hooks do not re-insert it at every step
+            sub_dict.clear()
     return gathered_io_dict
 
 
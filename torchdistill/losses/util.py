@@ -1,3 +1,5 @@
+import torch
+
 FUNC2EXTRACT_ORG_OUTPUT_DICT = dict()
 
 
@@ -13,7 +15,7 @@ def extract_simple_org_loss(org_criterion, student_outputs, teacher_outputs, tar
         # Models with auxiliary classifier returns multiple outputs
         if isinstance(student_outputs, (list, tuple)):
             if uses_teacher_output:
-                for i, sub_student_outputs, sub_teacher_outputs in enumerate(zip(student_outputs, teacher_outputs)):
+                for i, (sub_student_outputs, sub_teacher_outputs) in enumerate(zip(student_outputs, teacher_outputs)):
                     org_loss_dict[i] = org_criterion(sub_student_outputs, sub_teacher_outputs, targets)
             else:
                 for i, sub_outputs in enumerate(student_outputs):
@@ -25,6 +27,26 @@ def extract_simple_org_loss(org_criterion, student_outputs, teacher_outputs, tar
     return org_loss_dict
 
 
+@register_func2extract_org_output
+def extract_batched_org_loss(org_criterion, student_outputs, teacher_outputs, targets, uses_teacher_output, **kwargs):
+    # Models with auxiliary classifier returns multiple outputs of the same shape, which are concatenated along
+    # batch dimension to compute the loss by a single criterion call. Assuming the criterion averages over batch,
+    # the result scaled by the number of outputs equals the sum of the output-wise losses
+    if org_criterion is None or not isinstance(student_outputs, (list, tuple)):
+        return extract_simple_org_loss(org_criterion, student_outputs, teacher_outputs, targets,
+                                       uses_teacher_output, **kwargs)
+
+    num_outputs = len(student_outputs)
+    batched_student_outputs = torch.cat(student_outputs, dim=0)
+    batched_targets = None if targets is None else targets.repeat(num_outputs, *([1] * (targets.dim() - 1)))
+    if uses_teacher_output:
+        batched_teacher_outputs = torch.cat(teacher_outputs, dim=0)
+        org_loss = org_criterion(batched_student_outputs, batched_teacher_outputs, batched_targets)
+    else:
+        org_loss = org_criterion(batched_student_outputs, batched_targets)
+    return {0: num_outputs * org_loss}
+
+
 @register_func2extract_org_output
 def extract_simple_org_loss_dict(org_criterion, student_outputs, teacher_outputs, targets,
                                  uses_teacher_output, **kwargs):